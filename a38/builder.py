@@ -83,3 +83,13 @@ if HAVE_LXML:
         def get_tree(self):
             root = self.etreebuilder.close()
             return lxml.etree.ElementTree(root)
+
+
+def serialize_tree(tree) -> str:
+    """
+    Serialize a tree built by Builder or LXMLBuilder to a string, without
+    XML declaration
+    """
+    if HAVE_LXML and isinstance(tree, lxml.etree._ElementTree):
+        return lxml.etree.tostring(tree, encoding="unicode")
+    return ET.tostring(tree.getroot(), encoding="unicode")
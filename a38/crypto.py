@@ -42,20 +42,40 @@ class P7M:
         """
         if isinstance(data, str):
             with open(data, "rb") as fd:
-                self.data = fd.read()
-        elif isinstance(data, bytes):
-            self.data = data
-        else:
-            self.data = data.read()
+                data = fd.read()
+        elif not isinstance(data, bytes):
+            data = data.read()
 
         # Data might potentially be base64 encoded
 
         try:
-            self.data = base64.b64decode(self.data, validate=True)
+            data = base64.b64decode(data, validate=True)
         except binascii.Error:
             pass
 
-        self.content_info = ContentInfo.load(self.data)
+        self.data = data
+
+    @property
+    def data(self) -> bytes:
+        """
+        DER encoded p7m data
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value: bytes):
+        self._data = value
+        self._content_info = None
+
+    @property
+    def content_info(self) -> ContentInfo:
+        """
+        ContentInfo structure of the p7m data, parsed on first access and
+        parsed again after data is changed
+        """
+        if self._content_info is None:
+            self._content_info = ContentInfo.load(self._data)
+        return self._content_info
 
     def is_expired(self) -> bool:
         """
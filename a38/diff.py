@@ -5,6 +5,8 @@ from .traversal import Annotation, Traversal
 
 
 class Difference(Annotation):
+    __slots__ = ("first", "second")
+
     def __init__(self, prefix: Optional[str], field: "fields.Field", first: Any, second: Any):
         super().__init__(prefix, field)
         self.first = first
@@ -18,6 +20,8 @@ class Difference(Annotation):
 
 
 class MissingOne(Difference):
+    __slots__ = ()
+
     def __str__(self):
         if self.first is None:
             return "{}: first is not set".format(self.qualified_field)
@@ -26,6 +30,8 @@ class MissingOne(Difference):
 
 
 class ExtraItems(Difference):
+    __slots__ = ()
+
     def __str__(self):
         if len(self.first) > len(self.second):
             diff = len(self.first) - len(self.second)
@@ -41,6 +47,8 @@ class ExtraItems(Difference):
 
 
 class Diff(Traversal):
+    __slots__ = ("differences",)
+
     def __init__(self, prefix: Optional[str] = None, differences: Optional[List[Difference]] = None):
         super().__init__(prefix)
         self.differences: List[Difference]
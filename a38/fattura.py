@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import re
-from typing import TYPE_CHECKING, Any, Dict, Union
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Dict, Tuple, Type, Union
 
 from . import consts, fields, models
 
@@ -38,6 +39,10 @@ NS = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"
 NS10 = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.0"
 NS_SIG = "http://www.w3.org/2000/09/xmldsig#"
 
+# Decimal constants used in computing totals
+_ZERO = Decimal(0)
+_HUNDRED = Decimal(100)
+
 
 class FullNameMixin:
     """
@@ -46,6 +51,7 @@ class FullNameMixin:
     Validate that nome+cognome and denominazione are mutually exclusive, and
     provide a full_name property that returns whichever is set.
     """
+    __slots__ = ()
 
     @property
     def full_name(self):
@@ -61,41 +67,29 @@ class FullNameMixin:
         else:
             return None
 
+    # Errors to report, indexed by a bitmask of which of nome (4), cognome (2)
+    # and denominazione (1) are set
+    _full_name_errors = (
+        (("nome", "cognome", "denominazione"), "nome and cognome, or denominazione, must be set"),
+        None,
+        (("nome",), "nome and cognome must both be set if denominazione is empty"),
+        (("cognome",), "cognome must not be set if denominazione is not empty"),
+        (("cognome",), "nome and cognome must both be set if denominazione is empty"),
+        (("nome",), "nome must not be set if denominazione is not empty"),
+        None,
+        (("nome", "cognome"), "nome and cognome must not be set if denominazione is not empty"),
+    )
+
     def validate_model(self, validation):
         super().validate_model(validation)
-        if self.denominazione is None:
-            if self.nome is None and self.cognome is None:
-                validation.add_error(
-                    (
-                        self._meta["nome"],
-                        self._meta["cognome"],
-                        self._meta["denominazione"],
-                    ),
-                    "nome and cognome, or denominazione, must be set",
-                )
-            elif self.nome is None:
-                validation.add_error(
-                    self._meta["nome"],
-                    "nome and cognome must both be set if denominazione is empty",
-                )
-            elif self.cognome is None:
-                validation.add_error(
-                    self._meta["cognome"],
-                    "nome and cognome must both be set if denominazione is empty",
-                )
-        else:
-            should_not_be_set = []
-            if self.nome is not None:
-                should_not_be_set.append(self._meta["nome"])
-            if self.cognome is not None:
-                should_not_be_set.append(self._meta["cognome"])
-            if should_not_be_set:
-                validation.add_error(
-                    should_not_be_set,
-                    "{} must not be set if denominazione is not empty".format(
-                        " and ".join(x.name for x in should_not_be_set)
-                    ),
-                )
+        error = self._full_name_errors[
+            (self.nome is not None) << 2
+            | (self.cognome is not None) << 1
+            | (self.denominazione is not None)
+        ]
+        if error is not None:
+            names, msg = error
+            validation.add_errors_many([self._meta[name] for name in names], msg)
 
 
 @export
@@ -133,10 +127,17 @@ class DatiTrasmissione(models.Model):
         null=True, min_length=8, max_length=256, xmltag="PECDestinatario"
     )
 
+    # Length of codice_destinatario that is not valid for each
+    # formato_trasmissione, and the error message to report for it
+    _codice_destinatario_bad_length = {
+        "FPA12": (7, "codice_destinatario has 7 characters on a Fattura PA"),
+        "FPR12": (6, "codice_destinatario has 6 characters on a Fattura Privati"),
+    }
+
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.codice_destinatario is None and self.pec_destinatario is None:
-            validation.add_error(
+            validation.add_errors_many(
                 (self._meta["codice_destinatario"], self._meta["pec_destinatario"]),
                 "one of codice_destinatario or pec_destinatario must be set",
             )
@@ -147,7 +148,7 @@ class DatiTrasmissione(models.Model):
         # valorizzato il campo PECDestinatario
 
         if self.pec_destinatario is None and self.codice_destinatario == "0000000":
-            validation.add_error(
+            validation.add_errors_many(
                 (self._meta["codice_destinatario"], self._meta["pec_destinatario"]),
                 "pec_destinatario has no value while codice_destinatario has value 0000000",
                 code="00426",
@@ -158,24 +159,20 @@ class DatiTrasmissione(models.Model):
             and self.codice_destinatario is not None
             and self.codice_destinatario != "0000000"
         ):
-            validation.add_error(
+            validation.add_errors_many(
                 (self._meta["codice_destinatario"], self._meta["pec_destinatario"]),
                 "pec_destinatario has value while codice_destinatario has value 0000000",
                 code="00426",
             )
 
-        if self.formato_trasmissione == "FPA12" and len(self.codice_destinatario) == 7:
-            validation.add_error(
-                self._meta["codice_destinatario"],
-                "codice_destinatario has 7 characters on a Fattura PA",
-                code="00427",
-            )
-
-        if self.formato_trasmissione == "FPR12" and len(self.codice_destinatario) == 6:
-            validation.add_error(
-                self._meta["codice_destinatario"],
-                "codice_destinatario has 6 characters on a Fattura Privati",
-                code="00427",
+        bad_length = self._codice_destinatario_bad_length.get(self.formato_trasmissione)
+        if (
+            bad_length is not None
+            and self.codice_destinatario is not None
+            and len(self.codice_destinatario) == bad_length[0]
+        ):
+            validation.add_error_one(
+                self._meta["codice_destinatario"], bad_length[1], code="00427"
             )
 
 
@@ -259,7 +256,7 @@ class DatiAnagraficiCessionarioCommittente(models.Model):
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.id_fiscale_iva is None and self.codice_fiscale is None:
-            validation.add_error(
+            validation.add_errors_many(
                 (self._meta["id_fiscale_iva"], self._meta["codice_fiscale"]),
                 "at least one of id_fiscale_iva and codice_fiscale needs to have a value",
                 code="00417",
@@ -353,13 +350,13 @@ class DatiCassaPrevidenziale(models.Model):
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.aliquota_iva == 0 and self.natura is None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "field is empty while aliquota_iva is zero",
                 code="00413",
             )
         if self.aliquota_iva != 0 and self.natura is not None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "field has value while aliquota_iva is not zero",
                 code="00414",
@@ -398,14 +395,14 @@ class DatiGeneraliDocumento(models.Model):
                 break
 
         if has_dati_cassa_previdenziale_ritenuta and not self.dati_ritenuta.has_value():
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["ritenuta"],
                 "field empty when dati_cassa_previdenziale.ritenuta is SI",
                 code="00415",
             )
 
         if self.numero is None or not re.search(r"\d", self.numero):
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["numero"],
                 "numero must contain at least one number",
                 code="00425",
@@ -452,21 +449,21 @@ class DettaglioLinee(models.Model):
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.quantita is None and self.unita_misura is not None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["quantita"], "field must be present when unita_misura is set"
             )
         if self.quantita is not None and self.unita_misura is None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["unita_misura"], "field must be present when quantita is set"
             )
         if self.aliquota_iva == 0 and self.natura is None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "natura non presente a fronte di aliquota_iva pari a zero",
                 code="00400",
             )
         if self.aliquota_iva != 0 and self.natura is not None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "natura presente a fronte di aliquota_iva diversa da zero",
                 code="00401",
@@ -506,13 +503,13 @@ class DatiRiepilogo(models.Model):
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.aliquota_iva == 0 and self.natura is None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "field is empty while aliquota_iva is zero",
                 code="00429",
             )
         if self.aliquota_iva != 0 and self.natura is not None:
-            validation.add_error(
+            validation.add_error_one(
                 self._meta["natura"],
                 "field has value while aliquota_iva is not zero",
                 code="00430",
@@ -551,17 +548,15 @@ class DatiBeniServizi(models.Model):
         For anything more complicated, you need to compute dati_riepilogo
         yourself, or better, extend this function and submit a pull request.
         """
-        from collections import defaultdict
-
-        # Group by aliquota
-        by_aliquota = defaultdict(list)
+        # Sum prezzo_totale grouping by aliquota
+        by_aliquota = {}
         for linea in self.dettaglio_linee:
-            by_aliquota[(linea.aliquota_iva, linea.natura)].append(linea)
+            key = (linea.aliquota_iva, linea.natura)
+            by_aliquota[key] = by_aliquota.get(key, _ZERO) + linea.prezzo_totale
 
         self.dati_riepilogo = []
-        for (aliquota, natura), linee in sorted(by_aliquota.items()):
-            imponibile = sum(linea.prezzo_totale for linea in linee)
-            imposta = imponibile * aliquota / 100
+        for (aliquota, natura), imponibile in sorted(by_aliquota.items()):
+            imposta = imponibile * aliquota / _HUNDRED
             self.dati_riepilogo.append(
                 DatiRiepilogo(
                     aliquota_iva=aliquota,
@@ -676,7 +671,7 @@ class DatiGenerali(models.Model):
             if dfc.data is None:
                 continue
             if self.dati_generali_documento.data < dfc.data:
-                validation.add_error(
+                validation.add_errors_many(
                     (
                         dfc._meta["data"],
                         self.dati_generali_documento._meta["data"],
@@ -759,8 +754,9 @@ class FatturaElettronicaBody(models.Model):
         submit a pull request.
         """
         totale = sum(
-            r.imponibile_importo + r.imposta
-            for r in self.dati_beni_servizi.dati_riepilogo
+            (r.imponibile_importo + r.imposta
+             for r in self.dati_beni_servizi.dati_riepilogo),
+            _ZERO,
         )
         self.dati_generali.dati_generali_documento.importo_totale_documento = totale
 
@@ -779,7 +775,7 @@ class FatturaElettronicaBody(models.Model):
             has_ritenute
             and not self.dati_generali.dati_generali_documento.dati_ritenuta.has_value()
         ):
-            validation.add_error(
+            validation.add_error_one(
                 self.dati_generali.dati_generali_documento._meta["dati_ritenuta"],
                 "field empty while at least one of dati_beni_servizi.dettaglio_linee.ritenuta is SI",
                 code="00411",
@@ -790,7 +786,7 @@ class FatturaElettronicaBody(models.Model):
                 has_aliquote_iva = True
 
         if not self.dati_beni_servizi.dati_riepilogo and has_aliquote_iva:
-            validation.add_error(
+            validation.add_error_one(
                 self.dati_beni_servizi._meta["dati_riepilogo"],
                 "dati_riepilogo is empty while there is at least an aliquota_iva"
                 " in dettaglio_linee or dati_cassa_previdenziale",
@@ -798,6 +794,37 @@ class FatturaElettronicaBody(models.Model):
             )
 
 
+# Fattura classes instantiated by auto_from_etree, indexed by root element tag
+# and versione
+_AUTO_REGISTRY: Dict[Tuple[str, str], Type[models.Model]] = {}
+
+
+def register_auto(versione: str):
+    """
+    Class decorator registering a fattura class with the given versione, for
+    use by auto_from_etree
+    """
+    def register(cls):
+        _AUTO_REGISTRY[(cls.get_xmltag(), versione)] = cls
+        return cls
+    return register
+
+
+def _copy_model_arguments(model_cls: Type[models.Model], args, kw) -> Dict[str, Any]:
+    """
+    Return the constructor arguments of model_cls as keyword arguments, with
+    copies of the models passed by the caller, so that changes to the new
+    model do not affect them
+    """
+    kw.update(zip(model_cls._meta.keys(), args))
+    for name, value in kw.items():
+        if isinstance(value, models.Model):
+            kw[name] = value.deep_copy()
+        elif isinstance(value, list):
+            kw[name] = [v.deep_copy() if isinstance(v, models.Model) else v for v in value]
+    return kw
+
+
 @export
 class Fattura(models.Model):
     __xmlns__ = NS
@@ -808,7 +835,9 @@ class Fattura(models.Model):
     signature = fields.NotImplementedField(null=True, xmlns=NS_SIG)
 
     def __init__(self, *args, **kw):
-        super().__init__(*args, **kw)
+        # Setting formato_trasmissione must not affect a header passed by the
+        # caller
+        super().__init__(**_copy_model_arguments(self.__class__, args, kw))
         self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = (
             self.get_versione()
         )
@@ -825,7 +854,7 @@ class Fattura(models.Model):
             self.get_versione()
             != self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione
         ):
-            validation.add_error(
+            validation.add_error_one(
                 self.fattura_elettronica_header.dati_trasmissione._meta[
                     "formato_trasmissione"
                 ],
@@ -841,11 +870,17 @@ class Fattura(models.Model):
 
     def build_etree(self, lxml=False):
         """
-        Build and return an ElementTree with the fattura in XML format
+        Build and return an ElementTree with the fattura in XML format.
+
+        If formato_trasmissione in the header does not match the fattura
+        version, the header is first replaced with a copy with the right
+        value, to avoid changing a header that may be shared with other models
         """
-        self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = (
-            self.get_versione()
-        )
+        versione = self.get_versione()
+        if self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione != versione:
+            # The header may be shared with other models: change a copy
+            self.fattura_elettronica_header = self.fattura_elettronica_header.deep_copy()
+            self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = versione
         if lxml:
             from a38.builder import LXMLBuilder
 
@@ -858,6 +893,13 @@ class Fattura(models.Model):
         self.to_xml(builder)
         return builder.get_tree()
 
+    def to_xml_string(self, lxml=False) -> str:
+        """
+        Return the fattura in XML format as a string, without XML declaration
+        """
+        from a38.builder import serialize_tree
+        return serialize_tree(self.build_etree(lxml=lxml))
+
     def from_etree(self, el):
         versione = el.attrib.get("versione", None)
         if versione is None:
@@ -876,6 +918,7 @@ class Fattura(models.Model):
 
 
 @export
+@register_auto("FPR12")
 class FatturaPrivati12(Fattura):
     """
     Fattura privati 1.2
@@ -886,6 +929,7 @@ class FatturaPrivati12(Fattura):
 
 
 @export
+@register_auto("FPA12")
 class FatturaPA12(Fattura):
     """
     Fattura PA 1.2
@@ -902,40 +946,27 @@ def auto_from_etree(
     """
     Instantiate a Fattura or FatturaElettronicaSemplificata from a parsed XML
     """
-    from .fattura_semplificata import NS10, FatturaElettronicaSemplificata
-
-    tagname_ordinaria = "{{{}}}FatturaElettronica".format(NS)
-    tagname_semplificata = "{{{}}}FatturaElettronicaSemplificata".format(NS10)
+    # Importing fattura_semplificata registers FatturaElettronicaSemplificata
+    from . import fattura_semplificata  # noqa: F401
 
     versione = root.attrib.get("versione", None)
-
-    if root.tag == tagname_ordinaria:
-        if versione is None:
+    cls = _AUTO_REGISTRY.get((root.tag, versione))
+    if cls is None:
+        tagname_ordinaria = "{{{}}}FatturaElettronica".format(NS)
+        tagname_semplificata = "{{{}}}FatturaElettronicaSemplificata".format(NS10)
+        if root.tag not in (tagname_ordinaria, tagname_semplificata):
             raise RuntimeError(
-                "root element {} misses attribute 'versione'".format(root.tag)
+                "Root element {} is neither {} nor {}".format(
+                    root.tag, tagname_ordinaria, tagname_semplificata
+                )
             )
-        if versione == "FPR12":
-            res = FatturaPrivati12()
-        elif versione == "FPA12":
-            res = FatturaPA12()
-        else:
-            raise RuntimeError("unsupported versione {}".format(versione))
-    elif root.tag == tagname_semplificata:
         if versione is None:
             raise RuntimeError(
                 "root element {} misses attribute 'versione'".format(root.tag)
             )
-        if versione == "FSM10":
-            res = FatturaElettronicaSemplificata()
-        else:
-            raise RuntimeError("unsupported versione {}".format(versione))
-    else:
-        raise RuntimeError(
-            "Root element {} is neither {} nor {}".format(
-                root.tag, tagname_ordinaria, tagname_semplificata
-            )
-        )
+        raise RuntimeError("unsupported versione {}".format(versione))
 
+    res = cls()
     res.from_etree(root)
     return res
 
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 from . import consts, fields, models
 from .fattura import (Allegati, FullNameMixin, IdFiscaleIVA, IdTrasmittente,
-                      IscrizioneREA, Sede, StabileOrganizzazione)
+                      IscrizioneREA, Sede, StabileOrganizzazione,
+                      _copy_model_arguments, register_auto)
 
 NS10 = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.0"
 
@@ -101,6 +102,7 @@ class FatturaElettronicaBody(models.Model):
     allegati = fields.ModelListField(Allegati, null=True)
 
 
+@register_auto("FSM10")
 class FatturaElettronicaSemplificata(models.Model):
     """
     Fattura elettronica semplificata
@@ -110,7 +112,9 @@ class FatturaElettronicaSemplificata(models.Model):
     fattura_elettronica_body = fields.ModelListField(FatturaElettronicaBody, min_num=1)
 
     def __init__(self, *args, **kw):
-        super().__init__(*args, **kw)
+        # Setting formato_trasmissione must not affect a header passed by the
+        # caller
+        super().__init__(**_copy_model_arguments(self.__class__, args, kw))
         self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = self.get_versione()
 
     def get_versione(self):
@@ -122,7 +126,7 @@ class FatturaElettronicaSemplificata(models.Model):
     def validate_model(self, validation):
         super().validate_model(validation)
         if self.get_versione() != self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione:
-            validation.add_error(
+            validation.add_error_one(
                     self.fattura_elettronica_header.dati_trasmissione._meta["formato_trasmissione"],
                     "formato_trasmissione should be {}".format(self.get_versione()),
                     code="00428")
@@ -135,9 +139,17 @@ class FatturaElettronicaSemplificata(models.Model):
 
     def build_etree(self, lxml=False):
         """
-        Build and return an ElementTree with the fattura in XML format
+        Build and return an ElementTree with the fattura in XML format.
+
+        If formato_trasmissione in the header does not match the fattura
+        version, the header is first replaced with a copy with the right
+        value, to avoid changing a header that may be shared with other models
         """
-        self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = self.get_versione()
+        versione = self.get_versione()
+        if self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione != versione:
+            # The header may be shared with other models: change a copy
+            self.fattura_elettronica_header = self.fattura_elettronica_header.deep_copy()
+            self.fattura_elettronica_header.dati_trasmissione.formato_trasmissione = versione
         if lxml:
             from a38.builder import LXMLBuilder
             builder = LXMLBuilder()
@@ -148,6 +160,13 @@ class FatturaElettronicaSemplificata(models.Model):
         self.to_xml(builder)
         return builder.get_tree()
 
+    def to_xml_string(self, lxml=False) -> str:
+        """
+        Return the fattura in XML format as a string, without XML declaration
+        """
+        from a38.builder import serialize_tree
+        return serialize_tree(self.build_etree(lxml=lxml))
+
     def from_etree(self, el):
         versione = el.attrib.get("versione", None)
         if versione is None:
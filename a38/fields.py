@@ -48,6 +48,7 @@ class Field(Generic[T]):
         self.xmltag = xmltag
         self.null = null
         self.default = default
+        self._xmltag_cache: Optional[str] = None
 
     def set_name(self, name: str):
         """
@@ -57,6 +58,7 @@ class Field(Generic[T]):
         attribute that defines it
         """
         self.name = name
+        self._xmltag_cache = None
 
     def get_construct_default(self) -> Optional[T]:
         """
@@ -80,10 +82,10 @@ class Field(Generic[T]):
         try:
             value = self.clean_value(value)
         except (TypeError, ValueError) as e:
-            validation.add_error(self, str(e))
+            validation.add_error_one(self, str(e))
 
         if not self.null and not self.has_value(value):
-            validation.add_error(self, "missing value")
+            validation.add_error_one(self, "missing value")
 
         return value
 
@@ -99,6 +101,15 @@ class Field(Generic[T]):
         """
         Return the XML tag to use for this field
         """
+        res = self._xmltag_cache
+        if res is None:
+            res = self._xmltag_cache = self._build_xmltag()
+        return res
+
+    def _build_xmltag(self) -> str:
+        """
+        Compute the XML tag returned by get_xmltag
+        """
         if self.xmltag is not None:
             if self.xmlns is not None:
                 return "{" + self.xmlns + "}" + self.xmltag
@@ -187,13 +198,15 @@ class ChoicesField(Field[T]):
         self.choices: Optional[List[Optional[T]]]
         if choices is not None:
             self.choices = [self.clean_value(c) for c in choices]
+            self._choices_set = frozenset(self.choices)
         else:
             self.choices = None
+            self._choices_set = None
 
     def validate(self, validation: "validation.Validation", value: Optional[T]):
         value = super().validate(validation, value)
-        if value is not None and self.choices is not None and value not in self.choices:
-            validation.add_error(self, "{} is not a valid choice for this field".format(self.to_repr(value)))
+        if value is not None and self._choices_set is not None and value not in self._choices_set:
+            validation.add_error_one(self, "{} is not a valid choice for this field".format(self.to_repr(value)))
         return value
 
 
@@ -208,6 +221,7 @@ class ListField(Field[List[T]]):
     def set_name(self, name: str):
         super().set_name(name)
         self.field.xmltag = self.get_xmltag()
+        self.field._xmltag_cache = None
 
     def get_construct_default(self):
         res = []
@@ -237,7 +251,7 @@ class ListField(Field[List[T]]):
         if not self.has_value(value):
             return value
         if len(value) < self.min_num:
-            validation.add_error(
+            validation.add_error_one(
                     self,
                     "list must have at least {} elements, but has only {}".format(
                         self.min_num, len(value)))
@@ -297,6 +311,8 @@ class IntegerField(ChoicesField[int]):
         self.max_length = max_length
 
     def clean_value(self, value):
+        if type(value) is int:
+            return value
         value = super().clean_value(value)
         if value is None:
             return value
@@ -307,7 +323,7 @@ class IntegerField(ChoicesField[int]):
         if not self.has_value(value):
             return value
         if self.max_length is not None and len(str(value)) > self.max_length:
-            validation.add_error(self, "'{}' should be no more than {} digits long".format(value, self.max_length))
+            validation.add_error_one(self, "'{}' should be no more than {} digits long".format(value, self.max_length))
         return value
 
 
@@ -373,7 +389,7 @@ class DecimalField(ChoicesField[Decimal]):
         if self.max_length is not None:
             xml_value = self.to_str(value)
             if len(xml_value) > self.max_length:
-                validation.add_error(
+                validation.add_error_one(
                         self,
                         "'{}' should be no more than {} digits long".format(xml_value, self.max_length))
         return value
@@ -406,8 +422,42 @@ class StringField(ChoicesField[str]):
         else:
             self.min_length = min_length
             self.max_length = max_length
+        self._check_length = self._make_length_check(self.min_length, self.max_length)
+
+    @staticmethod
+    def _make_length_check(min_length: Optional[int], max_length: Optional[int]):
+        """
+        Build a function checking only the length constraints that are set, or
+        return None if there are none
+        """
+        def too_short(field, validation, value):
+            validation.add_error_one(field, "'{}' should be at least {} characters long".format(value, min_length))
+
+        def too_long(field, validation, value):
+            validation.add_error_one(field, "'{}' should be no more than {} characters long".format(value, max_length))
+
+        if min_length is None and max_length is None:
+            return None
+        elif max_length is None:
+            def check_length(field, validation, value):
+                if len(value) < min_length:
+                    too_short(field, validation, value)
+        elif min_length is None:
+            def check_length(field, validation, value):
+                if len(value) > max_length:
+                    too_long(field, validation, value)
+        else:
+            def check_length(field, validation, value):
+                length = len(value)
+                if length < min_length:
+                    too_short(field, validation, value)
+                if length > max_length:
+                    too_long(field, validation, value)
+        return check_length
 
     def clean_value(self, value):
+        if type(value) is str:
+            return value
         value = super().clean_value(value)
         if value is None:
             return value
@@ -415,12 +465,10 @@ class StringField(ChoicesField[str]):
 
     def validate(self, validation, value):
         value = super().validate(validation, value)
-        if not self.has_value(value):
+        check_length = self._check_length
+        if check_length is None or not self.has_value(value):
             return value
-        if self.min_length is not None and len(value) < self.min_length:
-            validation.add_error(self, "'{}' should be at least {} characters long".format(value, self.min_length))
-        if self.max_length is not None and len(value) > self.max_length:
-            validation.add_error(self, "'{}' should be no more than {} characters long".format(value, self.max_length))
+        check_length(self, validation, value)
         return value
 
 
@@ -581,6 +629,9 @@ class ModelField(Field):
         return self.model()
 
     def clean_value(self, value):
+        # Instances of the model are kept as they are
+        if type(value) is self.model:
+            return value
         value = super().clean_value(value)
         if value is None:
             return value
@@ -591,7 +642,7 @@ class ModelField(Field):
             return False
         return value.has_value()
 
-    def get_xmltag(self):
+    def _build_xmltag(self):
         if self.xmltag is not None:
             if self.xmlns is not None:
                 return "{" + self.xmlns + "}" + self.xmltag
@@ -670,7 +721,9 @@ class ModelListField(Field):
         value = super().clean_value(value)
         if value is None:
             return value
-        res = [self.model.clean_value(val) for val in value]
+        model = self.model
+        model_clean_value = model.clean_value
+        res = [val if type(val) is model else model_clean_value(val) for val in value]
         while len(res) > self.min_num and (res[-1] is None or not res[-1].has_value()):
             res.pop()
         return res
@@ -685,7 +738,7 @@ class ModelListField(Field):
 
         return False
 
-    def get_xmltag(self):
+    def _build_xmltag(self):
         if self.xmltag is not None:
             return self.xmltag
         return self.model.get_xmltag()
@@ -696,7 +749,7 @@ class ModelListField(Field):
             return value
 
         if len(value) < self.min_num:
-            validation.add_error(
+            validation.add_error_one(
                     self,
                     "list must have at least {} elements, but has only {}".format(self.min_num, len(value)))
 
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import copy
 from collections import defaultdict
 from typing import Any, Dict, Optional, Tuple
 
@@ -43,7 +44,7 @@ class ModelMetaclass(type):
             _meta.update(b_meta)
 
         # Add fields from the class itself
-        slots = []
+        slots = list(dct.get("__slots__", ()))
         for field_name, val in list(dct.items()):
             if isinstance(val, Field):
                 # Store its description in the Model _meta
@@ -66,6 +67,16 @@ class ModelMetaclass(type):
         dct["__slots__"] = slots
         res = super().__new__(cls, name, bases, dct)
         res._meta = _meta
+        # Map XML tags to the fields they contain, for parsing
+        res._fields_by_tag = {field.get_xmltag(): (field_name, field) for field_name, field in _meta.items()}
+        res._field_cleaners = tuple(
+                (field_name, field.clean_value, field.get_construct_default) for field_name, field in _meta.items())
+        res._has_value_methods = tuple((field_name, field.has_value) for field_name, field in _meta.items())
+        # has_value can only be cached if all changes to the model go through
+        # __setattr__, that is, if there are no nested models or lists that
+        # can be modified in place
+        res._has_value_cacheable = not any(
+                field.multivalue or isinstance(field, ModelField) for field in _meta.values())
         return res
 
 
@@ -74,20 +85,21 @@ class Model(ModelBase, metaclass=ModelMetaclass):
     Declarative description of a data structure that can be validated and
     serialized to XML.
     """
-    __slots__ = ()
+    __slots__ = ("_has_value_cache", "_tuple_cache")
 
     def __init__(self, *args, **kw):
         super().__init__()
+        object.__setattr__(self, "_has_value_cache", None)
+        object.__setattr__(self, "_tuple_cache", None)
         for name, value in zip(self._meta.keys(), args):
             kw[name] = value
 
-        for name, field in self._meta.items():
+        # Clean each value once and store it directly, bypassing __setattr__
+        for name, clean_value, get_construct_default in self._field_cleaners:
             value = kw.pop(name, None)
             if value is None:
-                value = field.get_construct_default()
-            else:
-                value = field.clean_value(value)
-            setattr(self, name, value)
+                value = get_construct_default()
+            object.__setattr__(self, name, clean_value(value))
 
     def update(self, *args, **kw):
         """
@@ -103,32 +115,40 @@ class Model(ModelBase, metaclass=ModelMetaclass):
             setattr(self, name, value)
 
     def has_value(self):
-        for name, field in self._meta.items():
-            if field.has_value(getattr(self, name)):
-                return True
-        return False
+        if not self._has_value_cacheable:
+            return any(has_value(getattr(self, name)) for name, has_value in self._has_value_methods)
+        res = self._has_value_cache
+        if res is None:
+            res = self._has_value_cache = any(
+                    has_value(getattr(self, name)) for name, has_value in self._has_value_methods)
+        return res
 
     @classmethod
     def clean_value(cls, value: Any) -> Optional["Model"]:
         """
         Create a model from the given value.
 
-        Always make a copy even if value is already of the right class, to
-        prevent mutability issues.
+        If value is already an instance of this class, it is returned as is:
+        use deep_copy() to get an independent copy.
         """
         if value is None:
             return None
+        if type(value) is cls:
+            return value
         if isinstance(value, dict):
             return cls(**value)
         elif isinstance(value, ModelBase):
-            kw = {}
-            for name, field in cls._meta.items():
-                kw[name] = getattr(value, name, None)
-            return cls(**kw)
+            return cls(**{name: getattr(value, name, None) for name in cls._meta})
         else:
             raise TypeError(f"{cls.__name__}: {value!r} is {type(value).__name__}"
                             " instead of a Model or dict instance")
 
+    def deep_copy(self) -> "Model":
+        """
+        Return a copy of this model, that shares no mutable values with it
+        """
+        return copy.deepcopy(self)
+
     def validate_fields(self, validation: Validation):
         for name, field in self._meta.items():
             field.validate(validation, getattr(self, name))
@@ -170,13 +190,34 @@ class Model(ModelBase, metaclass=ModelMetaclass):
                 field.to_xml(b, getattr(self, name))
 
     def __setattr__(self, key: str, value: any):
-        field = self._meta.get(key, None)
+        # Models only have slots: misspelled field names raise AttributeError
+        # in object.__setattr__
+        field = self._meta.get(key)
         if field is not None:
             value = field.clean_value(value)
-        super().__setattr__(key, value)
+            object.__setattr__(self, "_has_value_cache", None)
+            object.__setattr__(self, "_tuple_cache", None)
+        object.__setattr__(self, key, value)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Copies and pickles only carry the field values: the caches would
+        # reference the values of the original model
+        return {name: getattr(self, name) for name in self._meta.keys()}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        object.__setattr__(self, "_has_value_cache", None)
+        object.__setattr__(self, "_tuple_cache", None)
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
     def _to_tuple(self) -> Tuple[Any]:
-        return tuple(getattr(self, name) for name in self._meta.keys())
+        # The tuple references the field values, so it stays valid if they
+        # are modified in place, and only needs rebuilding on assignment
+        res = self._tuple_cache
+        if res is None:
+            res = tuple(getattr(self, name) for name in self._meta.keys())
+            object.__setattr__(self, "_tuple_cache", res)
+        return res
 
     def __eq__(self, other):
         other = self.clean_value(other)
@@ -262,26 +303,23 @@ class Model(ModelBase, metaclass=ModelMetaclass):
         if el.tag != self.get_xmltag():
             raise RuntimeError("element is {} instead of {}".format(el.tag, self.get_xmltag()))
 
-        tag_map = {field.get_xmltag(): (name, field) for name, field in self._meta.items()}
+        fields_by_tag = self._fields_by_tag
 
         # Group values by tag
-        by_name = defaultdict(list)
+        by_tag = defaultdict(list)
         for child in el:
-            try:
-                name, field = tag_map[child.tag]
-            except KeyError:
+            if child.tag not in fields_by_tag:
                 raise RuntimeError("found unexpected element {} in {}".format(child.tag, el.tag))
+            by_tag[child.tag].append(child)
 
-            by_name[name].append(child)
-
-        for name, elements in by_name.items():
-            field = self._meta[name]
+        for tag, elements in by_tag.items():
+            name, field = fields_by_tag[tag]
             if field.multivalue:
                 setattr(self, name, field.from_etree(elements))
             elif len(elements) != 1:
                 raise RuntimeError(
                         "found {} {} elements in {} instead of just 1".format(
-                            len(elements), child.tag, el.tag))
+                            len(elements), tag, el.tag))
             else:
                 setattr(self, name, field.from_etree(elements[0]))
 
@@ -6,6 +6,8 @@ if TYPE_CHECKING:
 
 
 class Annotation:
+    __slots__ = ("prefix", "field")
+
     def __init__(self, prefix: Optional[str], field: "fields.Field"):
         self.prefix = prefix
         self.field = field
@@ -21,6 +23,8 @@ class Annotation:
 
 
 class Traversal:
+    __slots__ = ("prefix",)
+
     def __init__(self, prefix: Optional[str] = None):
         self.prefix = prefix
 
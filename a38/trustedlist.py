@@ -1,18 +1,34 @@
 import base64
+import hashlib
+import io
+import json
 import logging
+import os
 import re
-import subprocess
+import threading
+import time
 
 try:
     from defusedxml import ElementTree as ET
 except ModuleNotFoundError:
     import xml.etree.ElementTree as ET
 
+try:
+    import lxml.etree
+    HAVE_LXML = True
+except ModuleNotFoundError:
+    HAVE_LXML = False
+
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
 
+from asn1crypto import core as asn1_core
+from asn1crypto import x509 as asn1_x509
 from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509.oid import NameOID
 
 from . import fields, models
 
@@ -22,6 +38,31 @@ NS = "http://uri.etsi.org/02231/v2#"
 NS_XMLDSIG = "http://www.w3.org/2000/09/xmldsig#"
 NS_ADDTYPES = "http://uri.etsi.org/02231/v2/additionaltypes#"
 
+_EXPECTED_ROOT_TAG = "{{{}}}TrustServiceStatusList".format(NS)
+
+_BACKEND = default_backend()
+
+# Service statuses and types of the services whose certificates are loaded
+_GRANTED_STATUSES = frozenset((
+    "http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/recognisedatnationallevel",
+    "http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/granted",
+))
+_QC_TYPES = frozenset((
+    "http://uri.etsi.org/TrstSvc/Svctype/CA/QC",
+))
+
+# String types that OpenSSL canonicalizes when hashing certificate names
+_CANONICAL_STRING_TYPES = (
+    asn1_core.UTF8String, asn1_core.BMPString, asn1_core.UniversalString, asn1_core.PrintableString,
+    asn1_core.TeletexString, asn1_core.IA5String, asn1_core.VisibleString,
+)
+
+re_max_age = re.compile(r"\bmax-age=(\d+)")
+# Names of the certificate symlinks created by openssl rehash
+re_hash_link = re.compile(r"^[0-9a-f]{8}\.\d+$")
+# Characters not allowed in certificate file names
+re_clean_fname = re.compile(r"[^A-Za-z0-9_-]")
+
 
 class OtherInformation(models.Model):
     __xmlns__ = NS
@@ -129,93 +170,339 @@ class TrustServiceStatusList(models.Model):
 
     def get_tsl_pointer_by_territory(self, territory):
         for other_tsl_pointer in self.scheme_information.pointers_to_other_tsl.other_tsl_pointer:
-            territory = None
+            pointer_territory = None
             for oi in other_tsl_pointer.additional_information.other_information:
                 if oi.scheme_territory is not None:
-                    territory = oi.scheme_territory
+                    pointer_territory = oi.scheme_territory
                     break
-            if territory != "IT":
+            if pointer_territory != territory:
                 continue
             return other_tsl_pointer.tsl_location
 
 
 def auto_from_etree(root):
-    expected_tag = "{{{}}}TrustServiceStatusList".format(NS)
-    if root.tag != expected_tag:
-        raise RuntimeError("Root element {} is not {}".format(root.tag, expected_tag))
+    if root.tag != _EXPECTED_ROOT_TAG:
+        raise RuntimeError("Root element {} is not {}".format(root.tag, _EXPECTED_ROOT_TAG))
 
     res = TrustServiceStatusList()
     res.from_etree(root)
     return res
 
 
+def get_cache_dir() -> Path:
+    """
+    Return the directory used to cache downloaded trusted lists
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home) / "a38"
+    return Path.home() / ".cache" / "a38"
+
+
+def _cache_paths(url: str) -> Tuple[Path, Path]:
+    """
+    Return the pathnames of the cached body and metadata for url
+    """
+    cache_dir = get_cache_dir()
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return cache_dir / (key + ".xml"), cache_dir / (key + ".json")
+
+
+def _read_cache_meta(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the cache metadata for url, or None if url is not cached
+    """
+    body_path, meta_path = _cache_paths(url)
+    if not body_path.exists():
+        return None
+    try:
+        return json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_expires(res) -> Optional[float]:
+    """
+    Return the time until which a response can be used without revalidating
+    it, or None if it always needs revalidation
+    """
+    cache_control = res.headers.get("Cache-Control", "")
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return None
+    mo = re_max_age.search(cache_control)
+    if not mo:
+        return None
+    return time.time() + int(mo.group(1))
+
+
+_session = None
+
+
+def _get_session():
+    """
+    Return the requests.Session used for downloads, so that connections can
+    be reused across them
+    """
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def fetch_url(url: str) -> Path:
+    """
+    Download url into the local cache, and return the pathname of the cached
+    copy.
+
+    If url has been downloaded before, the cached copy is revalidated with a
+    conditional GET, and only downloaded again if it has changed.
+
+    Raises OSError if the cache directory cannot be used.
+    """
+    body_path, meta_path = _cache_paths(url)
+    meta = _read_cache_meta(url)
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+
+    headers = {}
+    if meta is not None:
+        expires = meta.get("expires")
+        if expires is not None and expires > time.time():
+            log.info("%s: cached copy is still fresh", url)
+            return body_path
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with _get_session().get(url, headers=headers, stream=True, timeout=30) as res:
+        if res.status_code == 304 and meta is not None:
+            log.info("%s: not modified, using cached copy", url)
+            meta["expires"] = _cache_expires(res)
+        else:
+            res.raise_for_status()
+            tmp_path = body_path.with_suffix(".tmp")
+            try:
+                with tmp_path.open("wb") as fd:
+                    # iter_content raises errors while reading the body as
+                    # requests exceptions
+                    for chunk in res.iter_content(chunk_size=65536):
+                        fd.write(chunk)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            tmp_path.replace(body_path)
+            meta = {
+                "url": url,
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+                "expires": _cache_expires(res),
+            }
+
+    meta_path.write_text(json.dumps(meta))
+    return body_path
+
+
+def open_url(url: str) -> BinaryIO:
+    """
+    Return a binary file object with the contents of url.
+
+    The download is cached with fetch_url, and if the cache directory cannot
+    be used, url is downloaded again without caching it.
+    """
+    import requests
+    try:
+        return fetch_url(url).open("rb")
+    except requests.RequestException:
+        raise
+    except OSError as e:
+        log.warning("%s: cannot use the download cache (%s), downloading without caching", url, e)
+
+    res = _get_session().get(url, timeout=30)
+    res.raise_for_status()
+    return io.BytesIO(res.content)
+
+
 def load_url(url: str):
     """
     Return a TrustedServiceStatusList instance from the XML downloaded from the
     given URL
     """
-    import requests
-    res = requests.get(url)
-    res.raise_for_status()
-    root = ET.fromstring(res.content)
+    with open_url(url) as fd:
+        if HAVE_LXML:
+            # Comments and processing instructions would show up as children
+            # of the elements, and the trusted lists do not need entities or
+            # ids
+            parser = lxml.etree.XMLParser(
+                    resolve_entities=False, collect_ids=False, remove_comments=True, remove_pis=True)
+            root = lxml.etree.parse(fd, parser=parser).getroot()
+        else:
+            root = ET.parse(fd).getroot()
     return auto_from_etree(root)
 
 
+def iter_tsp_services(fd: BinaryIO) -> Iterator[TSPService]:
+    """
+    Generate the TSPService entries of the TrustedServiceStatusList read from
+    the given binary file, parsing it incrementally instead of loading it all
+    in memory
+    """
+    root_tag = _EXPECTED_ROOT_TAG
+    service_tag = "{{{}}}TSPService".format(NS)
+    if HAVE_LXML:
+        events = lxml.etree.iterparse(
+                fd, events=("start", "end"), tag=(root_tag, service_tag),
+                resolve_entities=False, collect_ids=False, remove_comments=True, remove_pis=True)
+    else:
+        events = ET.iterparse(fd, events=("start", "end"))
+
+    root = None
+    for event, el in events:
+        if root is None:
+            # lxml only reports the elements matching tag, so the first one is
+            # not necessarily the root element
+            root = el.getroottree().getroot() if HAVE_LXML else el
+            if root.tag != root_tag:
+                raise RuntimeError("Root element {} is not {}".format(root.tag, root_tag))
+            continue
+        if event != "end" or el.tag != service_tag:
+            continue
+
+        tsp_service = TSPService()
+        tsp_service.from_etree(el)
+        yield tsp_service
+
+        # Release the memory used by the elements parsed so far
+        el.clear()
+        if HAVE_LXML:
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+    if root is None:
+        # No element matched with lxml: the root element is something else
+        raise RuntimeError("Root element {} is not {}".format(events.root.tag, root_tag))
+
+
+def _load_cached_certs(digest: str) -> Optional[Dict[str, x509.Certificate]]:
+    """
+    Return the certificates cached from a trusted list with the given digest,
+    or None if they are not available
+    """
+    pathname = get_cache_dir() / "certs.json"
+    try:
+        text = pathname.read_text()
+    except OSError:
+        return None
+
+    # Treat any malformed cache contents as a cache miss
+    try:
+        cached = json.loads(text)
+        if cached["digest"] != digest:
+            return None
+        return {
+            name: x509.load_der_x509_certificate(base64.b64decode(der, validate=True), _BACKEND)
+            for name, der in cached["certs"].items()
+        }
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        log.warning("%s: ignoring malformed certificate cache: %s", pathname, e)
+        return None
+
+
+def _save_cached_certs(digest: str, certs: Dict[str, x509.Certificate]):
+    """
+    Cache the certificates parsed from a trusted list with the given digest
+    """
+    cached = {
+        "digest": digest,
+        "certs": {
+            name: base64.b64encode(cert.public_bytes(serialization.Encoding.DER)).decode()
+            for name, cert in certs.items()
+        },
+    }
+    pathname = get_cache_dir() / "certs.json"
+    try:
+        pathname.write_text(json.dumps(cached))
+    except OSError as e:
+        log.warning("%s: cannot cache certificates: %s", pathname, e)
+
+
+# Digest of the IT trusted list and the certificates last loaded from it, to
+# skip loading them again in long running processes
+_certs_cache: Optional[Tuple[str, Dict[str, x509.Certificate]]] = None
+_certs_cache_lock = threading.Lock()
+
+
 def load_certs() -> Dict[str, x509.Certificate]:
     """
     Download trusted list certificates for Italy, parse them and return a dict
     mapping certificate names good for use as file names to cryptography.x509
     certificates
     """
-    re_clean_fname = re.compile(r"[^A-Za-z0-9_-]")
-
     eu_url = "https://ec.europa.eu/information_society/policy/esignature/trusted-list/tl-mp.xml"
     log.info("Downloading EU index from %s", eu_url)
     eu_tl = load_url(eu_url)
     it_url = eu_tl.get_tsl_pointer_by_territory("IT")
     log.info("Downloading IT data from %s", it_url)
-    trust_service_status_list = load_url(it_url)
+    with open_url(it_url) as fd:
+        digest = hashlib.file_digest(fd, "sha256").hexdigest()
+
+        global _certs_cache
+        with _certs_cache_lock:
+            if _certs_cache is not None and _certs_cache[0] == digest:
+                log.info("%s: trusted list unchanged, using certificates already loaded", it_url)
+                return dict(_certs_cache[1])
+
+            res = _load_cached_certs(digest)
+            if res is not None:
+                log.info("%s: trusted list unchanged, using cached certificates", it_url)
+            else:
+                fd.seek(0)
+                res = parse_certs(fd)
+                _save_cached_certs(digest, res)
+            _certs_cache = (digest, res)
+            return dict(res)
+
 
+def parse_certs(fd: BinaryIO) -> Dict[str, x509.Certificate]:
+    """
+    Parse the certificates of granted qualified CA services in the trusted
+    list read from the given binary file, and return a dict mapping
+    certificate names good for use as file names to cryptography.x509
+    certificates
+    """
     by_name = defaultdict(list)
-    for tsp in trust_service_status_list.trust_service_provider_list.trust_service_provider:
-        for tsp_service in tsp.tsp_services.tsp_service:
-            si = tsp_service.service_information
-            if si.service_status not in (
-                    "http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/recognisedatnationallevel",
-                    "http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/granted"):
-                continue
-            if si.service_type_identifier not in (
-                    "http://uri.etsi.org/TrstSvc/Svctype/CA/QC",):
-                continue
-            # print("identifier", si.service_type_identifier)
-            # print("status", si.service_status)
-            cert = []
-            sn = []
-            for di in si.service_digital_identity.digital_id:
-                if di.x509_subject_name is not None:
-                    sn.append(di.x509_subject_name)
-                # if di.x509_ski is not None:
-                #    print("  SKI:", di.x509_ski)
-                if di.x509_certificate is not None:
-                    from cryptography import x509
-                    from cryptography.hazmat.backends import default_backend
-                    der = base64.b64decode(di.x509_certificate)
-                    cert.append(x509.load_der_x509_certificate(der, default_backend()))
-
-            if len(cert) == 0:
-                raise RuntimeError("{} has no certificates".format(sn))
-            elif len(cert) > 1:
-                raise RuntimeError("{} has {} certificates".format(sn, len(cert)))
-            else:
-                from cryptography.x509.oid import NameOID
-                cert = cert[0]
-                cn = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
-                # print("sn", sn)
-                # print(cert)
-                # print("full cn", cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME))
-                # print("cn", cn)
-                fname = re_clean_fname.sub("_", cn)
-                by_name[fname].append(cert)
+    # The same certificate can appear in more than one service: parse it only
+    # once
+    parsed = {}
+    b64decode = base64.b64decode
+    load_der = x509.load_der_x509_certificate
+    for tsp_service in iter_tsp_services(fd):
+        si = tsp_service.service_information
+        if si.service_status not in _GRANTED_STATUSES:
+            continue
+        if si.service_type_identifier not in _QC_TYPES:
+            continue
+        cert = []
+        sn = []
+        for di in si.service_digital_identity.digital_id:
+            if di.x509_subject_name is not None:
+                sn.append(di.x509_subject_name)
+            if di.x509_certificate is not None:
+                der = b64decode(di.x509_certificate)
+                parsed_cert = parsed.get(der)
+                if parsed_cert is None:
+                    parsed_cert = parsed[der] = load_der(der, _BACKEND)
+                cert.append(parsed_cert)
+
+        if len(cert) == 0:
+            raise RuntimeError("{} has no certificates".format(sn))
+        elif len(cert) > 1:
+            raise RuntimeError("{} has {} certificates".format(sn, len(cert)))
+        else:
+            cert = cert[0]
+            cn = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
+            fname = re_clean_fname.sub("_", cn)
+            by_name[fname].append(cert)
 
     res = {}
     for name, certs in by_name.items():
@@ -232,25 +519,113 @@ def load_certs() -> Dict[str, x509.Certificate]:
     return res
 
 
+def _write_file(pathname: Path, data: bytes):
+    """
+    Write data to pathname, replacing its previous contents
+    """
+    fd = os.open(pathname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _der(tag: int, contents: bytes) -> bytes:
+    """
+    DER-encode a value given its tag and encoded contents
+    """
+    size = len(contents)
+    if size < 0x80:
+        return bytes((tag, size)) + contents
+    size_bytes = size.to_bytes((size.bit_length() + 7) // 8, "big")
+    return bytes((tag, 0x80 | len(size_bytes))) + size_bytes + contents
+
+
+def subject_hash(cert: x509.Certificate) -> str:
+    """
+    Compute the hash of the certificate subject that OpenSSL uses to look up
+    certificates in a CA directory, like ``openssl x509 -subject_hash``
+    """
+    # This is the SHA1 of the canonical encoding of the subject name, as built
+    # by OpenSSL's x509_name_canon: string values are converted to
+    # UTF8String, stripped, whitespace-collapsed and lowercased, and the
+    # outer SEQUENCE header is omitted
+    name = asn1_x509.Name.load(cert.subject.public_bytes())
+    canonical = []
+    for rdn in name.chosen:
+        attributes = []
+        for attribute in rdn:
+            value = attribute["value"]
+            if isinstance(value, asn1_core.Any):
+                value = value.parsed
+            if isinstance(value, asn1_core.Choice):
+                value = value.chosen
+            if isinstance(value, _CANONICAL_STRING_TYPES):
+                encoded = _der(0x0c, b" ".join(value.native.encode().split()).lower())
+            else:
+                encoded = attribute["value"].dump()
+            attributes.append(_der(0x30, attribute["type"].dump() + encoded))
+        canonical.append(_der(0x31, b"".join(sorted(attributes))))
+    digest = hashlib.sha1(b"".join(canonical), usedforsecurity=False).digest()
+    return "{:08x}".format(int.from_bytes(digest[:4], "little"))
+
+
+def rehash(destdir: Path, certs: Optional[Dict[str, x509.Certificate]] = None):
+    """
+    Recreate the subject hash symlinks to the certificates in destdir, like
+    ``openssl rehash`` does.
+
+    certs can map file names in destdir to their already parsed certificates,
+    to avoid reading them again.
+    """
+    if certs is None:
+        certs = {}
+
+    for pathname in destdir.iterdir():
+        if pathname.is_symlink() and re_hash_link.match(pathname.name):
+            pathname.unlink()
+
+    by_hash = defaultdict(list)
+    for fname in sorted(c.name for c in destdir.iterdir() if c.suffix in (".crt", ".pem", ".cer")):
+        cert = certs.get(fname)
+        if cert is None:
+            try:
+                cert = x509.load_pem_x509_certificate((destdir / fname).read_bytes(), _BACKEND)
+            except ValueError:
+                log.warning("%s: skipping file that does not contain a PEM certificate", destdir / fname)
+                continue
+        fingerprint = cert.fingerprint(hashes.SHA256())
+        entries = by_hash[subject_hash(cert)]
+        if any(fingerprint == f for f, n in entries):
+            log.info("%s: skipping duplicate certificate", destdir / fname)
+            continue
+        entries.append((fingerprint, fname))
+
+    for name_hash, entries in by_hash.items():
+        for idx, (fingerprint, fname) in enumerate(entries):
+            (destdir / "{}.{}".format(name_hash, idx)).symlink_to(fname)
+
+
 def update_capath(destdir: Path, remove_old=False):
-    from cryptography.hazmat.primitives import serialization
     certs = load_certs()
+    # Encode all certificates before starting to modify destdir
+    pems = {name + ".crt": cert.public_bytes(serialization.Encoding.PEM) for name, cert in certs.items()}
     if destdir.is_dir():
         current = set(c.name for c in destdir.iterdir() if c.name.endswith(".crt"))
     else:
         current = set()
         destdir.mkdir(parents=True)
-    for name, cert in certs.items():
-        fname = name + ".crt"
+    for fname, pem in pems.items():
         current.discard(fname)
         pathname = destdir / fname
-        with pathname.open(mode="wb") as fd:
-            fd.write(cert.public_bytes(serialization.Encoding.PEM))
-            log.info("%s: written", pathname)
+        _write_file(pathname, pem)
+        log.info("%s: written", pathname)
     if remove_old:
         for fname in current:
             pathname = destdir / fname
             pathname.unlink()
             log.info("%s: removed", pathname)
 
-    subprocess.run(["openssl", "rehash", destdir], check=True)
+    rehash(destdir, {name + ".crt": cert for name, cert in certs.items()})
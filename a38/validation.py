@@ -1,10 +1,12 @@
-from typing import List, Optional, Sequence, Union
+from typing import Iterable, List, Optional, Sequence, Union
 
 from . import fields
 from .traversal import Annotation, Traversal
 
 
 class ValidationError(Annotation):
+    __slots__ = ("msg", "code")
+
     def __init__(self, prefix: Optional[str], field: "fields.Field", msg: str, code: str = None):
         self.prefix = prefix
         self.field = field
@@ -22,6 +24,8 @@ Fields = Union["fields.Field", Sequence["fields.Field"]]
 
 
 class Validation(Traversal):
+    __slots__ = ("warnings", "errors")
+
     def __init__(self,
                  prefix: Optional[str] = None,
                  warnings: Optional[List[ValidationError]] = None,
@@ -43,14 +47,26 @@ class Validation(Traversal):
 
     def add_warning(self, field: Fields, msg: str, code: str = None):
         if isinstance(field, fields.Field):
-            self.warnings.append(ValidationError(self.prefix, field, msg, code))
+            self.add_warning_one(field, msg, code)
         else:
-            for f in field:
-                self.warnings.append(ValidationError(self.prefix, f, msg, code))
+            self.add_warnings_many(field, msg, code)
+
+    def add_warning_one(self, field: "fields.Field", msg: str, code: str = None):
+        self.warnings.append(ValidationError(self.prefix, field, msg, code))
+
+    def add_warnings_many(self, field_list: Iterable["fields.Field"], msg: str, code: str = None):
+        prefix = self.prefix
+        self.warnings.extend(ValidationError(prefix, f, msg, code) for f in field_list)
 
     def add_error(self, field: Fields, msg: str, code: str = None):
         if isinstance(field, fields.Field):
-            self.errors.append(ValidationError(self.prefix, field, msg, code))
+            self.add_error_one(field, msg, code)
         else:
-            for f in field:
-                self.errors.append(ValidationError(self.prefix, f, msg, code))
+            self.add_errors_many(field, msg, code)
+
+    def add_error_one(self, field: "fields.Field", msg: str, code: str = None):
+        self.errors.append(ValidationError(self.prefix, field, msg, code))
+
+    def add_errors_many(self, field_list: Iterable["fields.Field"], msg: str, code: str = None):
+        prefix = self.prefix
+        self.errors.extend(ValidationError(prefix, f, msg, code) for f in field_list)
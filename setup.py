@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+from pathlib import Path
+
 from setuptools import setup
 
 with open("README.md", "r") as fp:
@@ -6,7 +8,7 @@ with open("README.md", "r") as fp:
 
 
 def parse_requirements(filename):
-    line_iter = (line.strip() for line in open(filename))
+    line_iter = (line.strip() for line in Path(filename).read_text().splitlines())
     return [line for line in line_iter if line and not line.startswith("#")]
 
 
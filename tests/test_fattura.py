@@ -1,11 +1,11 @@
 import datetime
-import io
 import tempfile
 from decimal import Decimal
-from unittest import SkipTest, TestCase
+from unittest import SkipTest, TestCase, mock
 
 import a38
 from a38 import codec, validation
+from a38.builder import serialize_tree
 
 
 class TestFatturaMixin:
@@ -16,6 +16,17 @@ class TestFatturaMixin:
         self.assertEqual([str(x) for x in val.errors], errors)
 
 
+class TestModels(TestCase):
+    def test_slots(self):
+        from a38 import fattura_semplificata, models
+        for module in (a38.fattura, fattura_semplificata):
+            for name, cls in vars(module).items():
+                if not isinstance(cls, type) or not issubclass(cls, models.Model):
+                    continue
+                with self.subTest(model=cls.__qualname__, module=module.__name__):
+                    self.assertFalse(hasattr(cls(), "__dict__"))
+
+
 class TestAnagrafica(TestFatturaMixin, TestCase):
     def test_validation(self):
         a = a38.Anagrafica()
@@ -90,6 +101,16 @@ class TestDatiTrasmissione(TestFatturaMixin, TestCase):
         dt.codice_destinatario = None
         self.assert_validates(dt)
 
+        dt.formato_trasmissione = "FPA12"
+        dt.pec_destinatario = None
+        dt.codice_destinatario = "FUFUFUF"
+        self.assert_validates(dt, errors=[
+            "codice_destinatario: [00427] codice_destinatario has 7 characters on a Fattura PA",
+        ])
+
+        dt.codice_destinatario = "FUFUFU"
+        self.assert_validates(dt)
+
 
 class TestDatiBeniServizi(TestFatturaMixin, TestCase):
     def test_add_dettaglio_linee(self):
@@ -213,7 +234,17 @@ class TestFatturaElettronicaBody(TestFatturaMixin, TestCase):
 
 
 class TestFatturaPrivati12(TestFatturaMixin, TestCase):
-    def build_sample(self):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Build the sample once, and give each test its own copy
+        cls.sample = cls.build_sample()
+        # Serialize it once for the tests that only read its XML
+        cls.tree = cls.sample.build_etree()
+        cls.xml = serialize_tree(cls.tree)
+
+    @classmethod
+    def build_sample(cls):
         cedente_prestatore = a38.CedentePrestatore(
             a38.DatiAnagraficiCedentePrestatore(
                 a38.IdFiscaleIVA("IT", "01234567890"),
@@ -277,69 +308,89 @@ class TestFatturaPrivati12(TestFatturaMixin, TestCase):
         self.assertEqual(len(f.fattura_elettronica_body), 1)
         self.assertFalse(f.fattura_elettronica_body[0].has_value())
 
+    def test_shared_header(self):
+        header = a38.FatturaElettronicaHeader()
+        body = a38.FatturaElettronicaBody()
+        pa = a38.FatturaPA12(fattura_elettronica_header=header, fattura_elettronica_body=[body])
+        pr = a38.FatturaPrivati12(fattura_elettronica_header=header, fattura_elettronica_body=[body])
+
+        # The models passed to the constructors are left untouched
+        self.assertIsNone(header.dati_trasmissione.formato_trasmissione)
+        self.assertEqual(pa.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPA12")
+        self.assertEqual(pr.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPR12")
+
+        pa.fattura_elettronica_body[0].dati_generali.dati_generali_documento.numero = "1"
+        self.assertIsNone(body.dati_generali.dati_generali_documento.numero)
+        self.assertIsNone(pr.fattura_elettronica_body[0].dati_generali.dati_generali_documento.numero)
+
+        # Positional arguments are copied too
+        pr = a38.FatturaPrivati12(header, [body])
+        self.assertIsNone(header.dati_trasmissione.formato_trasmissione)
+        self.assertIsNot(pr.fattura_elettronica_body[0], body)
+
+        # build_etree does not change a header assigned after construction,
+        # and replaces it with a copy instead
+        pr.fattura_elettronica_header = header
+        pr.build_etree()
+        self.assertIsNone(header.dati_trasmissione.formato_trasmissione)
+        self.assertIsNot(pr.fattura_elettronica_header, header)
+        self.assertEqual(pr.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPR12")
+
+        # If the header is already right, build_etree keeps it
+        header = pr.fattura_elettronica_header
+        pr.build_etree()
+        self.assertIs(pr.fattura_elettronica_header, header)
+
+    def test_construct_without_copies(self):
+        # Models built by the constructor from dicts or defaults are not
+        # shared with the caller, and are not copied
+        with mock.patch.object(a38.models.Model, "deep_copy") as deep_copy:
+            a38.FatturaPrivati12()
+            a38.FatturaPrivati12(fattura_elettronica_header={}, fattura_elettronica_body=[{}])
+            f = a38.FatturaPrivati12()
+            f.from_etree(self.tree.getroot())
+        deep_copy.assert_not_called()
+
     def test_validate(self):
-        f = self.build_sample()
+        f = self.sample.deep_copy()
         self.assertEqual(f.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPR12")
         self.assert_validates(f)
 
     def test_serialize(self):
-        f = self.build_sample()
-        self.assertEqual(f.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPR12")
-        tree = f.build_etree()
-        with io.StringIO() as out:
-            tree.write(out, encoding="unicode")
-            xml = out.getvalue()
-
+        self.assertEqual(self.sample.fattura_elettronica_header.dati_trasmissione.formato_trasmissione, "FPR12")
         self.assertIn(
             '<ns0:FatturaElettronica xmlns:ns0="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"'
-            ' versione="FPR12">', xml)
-        self.assertIn('<FormatoTrasmissione>FPR12</FormatoTrasmissione>', xml)
+            ' versione="FPR12">', self.xml)
+        self.assertIn('<FormatoTrasmissione>FPR12</FormatoTrasmissione>', self.xml)
 
     def test_serialize_lxml(self):
         from a38 import builder
         if not builder.HAVE_LXML:
             raise SkipTest("lxml is not available")
 
-        f = self.build_sample()
-        tree = f.build_etree(lxml=True)
-        with io.BytesIO() as out:
-            tree.write(out)
-            xml = out.getvalue()
+        f = self.sample.deep_copy()
+        xml = f.to_xml_string(lxml=True)
 
         self.assertIn(
-            b'<ns0:FatturaElettronica xmlns:ns0="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"'
-            b' versione="FPR12">', xml)
-        self.assertIn(b'<FormatoTrasmissione>FPR12</FormatoTrasmissione>', xml)
+            '<ns0:FatturaElettronica xmlns:ns0="http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"'
+            ' versione="FPR12">', xml)
+        self.assertIn('<FormatoTrasmissione>FPR12</FormatoTrasmissione>', xml)
 
     def test_to_python(self):
-        f = self.build_sample()
+        f = self.sample.deep_copy()
         py = f.to_python(namespace="a38")
         parsed = eval(py)
         self.assertEqual(f, parsed)
 
     def test_parse(self):
-        f = self.build_sample()
-        tree = f.build_etree()
-        with io.StringIO() as out:
-            tree.write(out, encoding="unicode")
-            xml1 = out.getvalue()
-
         f = a38.FatturaPrivati12()
-        f.from_etree(tree.getroot())
+        f.from_etree(self.tree.getroot())
         self.assert_validates(f)
-        tree = f.build_etree()
-        with io.StringIO() as out:
-            tree.write(out, encoding="unicode")
-            xml2 = out.getvalue()
-
-        self.assertEqual(xml1, xml2)
+        self.assertEqual(f.to_xml_string(), self.xml)
 
-        f = a38.auto_from_etree(tree.getroot())
+        f = a38.auto_from_etree(self.tree.getroot())
         self.assert_validates(f)
-        tree = f.build_etree()
-        with io.StringIO() as out:
-            tree.write(out, encoding="unicode")
-            xml2 = out.getvalue()
+        self.assertEqual(f.to_xml_string(), self.xml)
 
 
 class TestSamples(TestFatturaMixin, TestCase):
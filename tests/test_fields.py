@@ -1,10 +1,9 @@
 import datetime
-import io
 from decimal import Decimal
 from unittest import TestCase
 
 from a38 import fields, models, validation
-from a38.builder import Builder
+from a38.builder import Builder, serialize_tree
 from a38.diff import Diff
 
 NS = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"
@@ -132,9 +131,7 @@ class FieldTestMixin:
         root = tree.getroot()
         if not list(root):
             return None
-        with io.StringIO() as out:
-            tree.write(out, encoding="unicode")
-            return out.getvalue()
+        return serialize_tree(tree)
 
     def mkdt(self, ye, mo, da, ho, mi, se=0, tz=None):
         if tz is None:
@@ -143,7 +140,12 @@ class FieldTestMixin:
 
 
 class TestField(FieldTestMixin, TestCase):
-    pass
+    def test_xmltag_rename(self):
+        # The tag is cached, and recomputed if the field is renamed
+        f = self.get_field()
+        self.assertEqual(f.get_xmltag(), "Sample")
+        f.set_name("other_sample")
+        self.assertEqual(f.get_xmltag(), "OtherSample")
 
 
 class TestStringField(FieldTestMixin, TestCase):
@@ -686,6 +688,11 @@ class TestListField(FieldTestMixin, TestCase):
         self.assertEqual(f.clean_value(None), ["test1", "test2"])
         self.assertEqual(self.to_xml(f, None), "<T><Sample>test1</Sample><Sample>test2</Sample></T>")
 
+        # Renaming the list also renames its elements
+        f.set_name("other_sample")
+        self.assertEqual(
+                self.to_xml(f, None), "<T><OtherSample>test1</OtherSample><OtherSample>test2</OtherSample></T>")
+
     def test_to_python(self):
         f = self.get_field()
         self.assert_to_python_works(f, ["test1", "foo"])
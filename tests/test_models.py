@@ -1,3 +1,5 @@
+import copy
+import pickle
 from unittest import TestCase
 
 from a38 import fields, models
@@ -13,6 +15,11 @@ class Sample1(models.Model):
     type = fields.StringField(choices=("A", "B"))
 
 
+class SampleList(models.Model):
+    name = fields.StringField()
+    values = fields.ListField(fields.IntegerField())
+
+
 class TestModel(TestCase):
     def test_assignment(self):
         o = Sample()
@@ -27,6 +34,12 @@ class TestModel(TestCase):
         with self.assertRaises(AttributeError):
             o.nome = "foo"
 
+    def test_slots(self):
+        # Model fields are stored in slots, with no per-instance __dict__
+        o = Sample()
+        self.assertFalse(hasattr(o, "__dict__"))
+        self.assertIn("name", Sample.__slots__)
+
     def test_clean_value(self):
         # Assign from a model
         val = Sample.clean_value(Sample1("foo", "A"))
@@ -40,6 +53,14 @@ class TestModel(TestCase):
         self.assertEqual(val.name, "foo")
         self.assertIsNone(val.value)
 
+        # Assign from a model of the same class
+        orig = Sample("foo", 1)
+        val = Sample.clean_value(orig)
+        self.assertIs(val, orig)
+        val = orig.deep_copy()
+        self.assertIsNot(val, orig)
+        self.assertEqual(val, orig)
+
         self.assertIsNone(Sample.clean_value(None))
         with self.assertRaises(TypeError):
             Sample.clean_value("foo")
@@ -59,3 +80,47 @@ class TestModel(TestCase):
         self.assertGreaterEqual(Sample("test", 7), Sample("test", 7))
         self.assertGreaterEqual(Sample("test", 7), None)
         self.assertGreaterEqual(Sample(), None)
+
+        # Assignment is reflected in comparisons after a previous comparison
+        o = Sample("test", 7)
+        self.assertEqual(o, Sample("test", 7))
+        o.value = 6
+        self.assertEqual(o, Sample("test", 6))
+        self.assertLess(o, Sample("test", 7))
+        o.update(value=8)
+        self.assertGreater(o, Sample("test", 7))
+
+    def test_copy(self):
+        orig = SampleList("test", [1, 2])
+        for name, make_copy in (
+                ("deep_copy", lambda o: o.deep_copy()),
+                ("deepcopy", copy.deepcopy),
+                ("pickle", lambda o: pickle.loads(pickle.dumps(o)))):
+            with self.subTest(copy=name):
+                # Compare first, to fill the cached comparison tuple
+                self.assertEqual(orig, make_copy(orig))
+                o = make_copy(orig)
+                self.assertIsNot(o.values, orig.values)
+                # In-place changes to the copy are seen by comparisons
+                o.values.clear()
+                self.assertEqual(o.values, [])
+                self.assertEqual(orig.values, [1, 2])
+                self.assertNotEqual(o, orig)
+
+        # Shallow copies share values but not the cached tuple
+        self.assertEqual(orig, orig)
+        o = copy.copy(orig)
+        self.assertIs(o.values, orig.values)
+        o.name = "other"
+        self.assertNotEqual(o, orig)
+
+    def test_has_value(self):
+        o = Sample()
+        self.assertFalse(o.has_value())
+        # Assignment invalidates the cached has_value result
+        o.value = 3
+        self.assertTrue(o.has_value())
+        o.value = None
+        self.assertFalse(o.has_value())
+        o.update(name="test")
+        self.assertTrue(o.has_value())
@@ -1,6 +1,6 @@
 import os
+import re
 import tempfile
-from contextlib import contextmanager
 from unittest import TestCase
 
 from a38.crypto import P7M, InvalidSignatureError
@@ -59,14 +59,25 @@ jkJbJNWfBsgjRHGg6Pq3enAf8/7DfkoCyKUzI8zZ
 
 CA_CERT_HASH = "b72ed47c.0"
 
+# openssl error messages expected by the verification tests
+RE_CONTENT_VERIFY_ERROR = re.compile(r"routines:CMS_verify:content verify error")
+RE_NO_LOCAL_ISSUER = re.compile(r"Verify error:\s*unable to get local issuer certificate")
+
 
 class TestSignature(TestCase):
-    @contextmanager
-    def capath(self):
-        with tempfile.TemporaryDirectory() as td:
-            with open(os.path.join(td, CA_CERT_HASH), "wt") as fd:
-                fd.write(CA_CERT)
-            yield td
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Verification only reads the CA directory, so all tests can share it
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.capath = cls.workdir.name
+        with open(os.path.join(cls.capath, CA_CERT_HASH), "wt") as fd:
+            fd.write(CA_CERT)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+        super().tearDownClass()
 
     def test_load(self):
         p7m = P7M("tests/data/test.txt.p7m")
@@ -77,22 +88,34 @@ class TestSignature(TestCase):
                 "\n"
                 "Questo è solo un payload di test.\n".encode("utf8"))
 
+    def test_set_data(self):
+        p7m = P7M("tests/data/test.txt.p7m")
+        signed_data = p7m.get_signed_data()
+        signed_data["encap_content_info"]["content"] = b"All your base are belong to us"
+        data = p7m.content_info.dump()
+
+        # Setting data causes it to be parsed again
+        p7m = P7M("tests/data/test.txt.p7m")
+        p7m.get_payload()
+        p7m.data = data
+        self.assertEqual(p7m.get_payload(), b"All your base are belong to us")
+
     def test_verify(self):
         p7m = P7M("tests/data/test.txt.p7m")
         if p7m.is_expired():
             self.skipTest("test signature has expired and needs to be regenerated")
-        with self.capath() as capath:
-            p7m.verify_signature(capath)
+        p7m.verify_signature(self.capath)
 
     def test_verify_corrupted_random(self):
         p7m = P7M("tests/data/test.txt.p7m")
         if p7m.is_expired():
             self.skipTest("test signature has expired and needs to be regenerated")
-        data_mid = len(p7m.data) // 2
-        p7m.data = p7m.data[:data_mid] + bytes([p7m.data[data_mid] + 1]) + p7m.data[data_mid + 1:]
-        with self.capath() as capath:
-            with self.assertRaises(InvalidSignatureError):
-                p7m.verify_signature(capath)
+        data = bytearray(p7m.data)
+        data_mid = len(data) // 2
+        data[data_mid] = (data[data_mid] + 1) & 0xFF
+        p7m.data = bytes(data)
+        with self.assertRaises(InvalidSignatureError):
+            p7m.verify_signature(self.capath)
 
     def test_verify_corrupted_payload(self):
         p7m = P7M("tests/data/test.txt.p7m")
@@ -102,15 +125,13 @@ class TestSignature(TestCase):
         encap_content_info = signed_data["encap_content_info"]
         encap_content_info["content"] = b"All your base are belong to us"
         p7m.data = p7m.content_info.dump()
-        with self.capath() as capath:
-            with self.assertRaisesRegex(InvalidSignatureError, r"routines:CMS_verify:content verify error"):
-                p7m.verify_signature(capath)
+        with self.assertRaisesRegex(InvalidSignatureError, RE_CONTENT_VERIFY_ERROR):
+            p7m.verify_signature(self.capath)
 
     def test_verify_noca(self):
         p7m = P7M("tests/data/test.txt.p7m")
         if p7m.is_expired():
             self.skipTest("test signature has expired and needs to be regenerated")
         with tempfile.TemporaryDirectory() as capath:
-            with self.assertRaisesRegex(
-                    InvalidSignatureError, r"Verify error:\s*unable to get local issuer certificate"):
+            with self.assertRaisesRegex(InvalidSignatureError, RE_NO_LOCAL_ISSUER):
                 p7m.verify_signature(capath)
@@ -0,0 +1,504 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from unittest import SkipTest, TestCase, mock
+
+from test_p7m import CA_CERT, CA_CERT_HASH
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    from a38 import trustedlist
+except ModuleNotFoundError:
+    trustedlist = None
+
+try:
+    import requests
+except ModuleNotFoundError:
+    requests = None
+
+# EU list of pointers to the national trusted lists
+EU_TSL = Path("tests/data/tsl_eu.xml")
+# Trusted list with two qualified CA services, a withdrawn one and a
+# timestamping service, all using the certificate from test_p7m
+IT_TSL = Path("tests/data/tsl_it.xml")
+
+# EU list whose only territory is given with an entity
+ENTITY_TSL = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE TrustServiceStatusList [<!ENTITY territory "IT">]>
+<TrustServiceStatusList xmlns="http://uri.etsi.org/02231/v2#">
+  <SchemeInformation><PointersToOtherTSL><OtherTSLPointer>
+    <TSLLocation>https://example.org/it.xml</TSLLocation>
+    <AdditionalInformation>
+      <OtherInformation><SchemeTerritory>&territory;</SchemeTerritory></OtherInformation>
+    </AdditionalInformation>
+  </OtherTSLPointer></PointersToOtherTSL></SchemeInformation>
+</TrustServiceStatusList>
+"""
+
+NS_STATUS = "http://uri.etsi.org/TrstSvc/TrustedList/Svcstatus/"
+NS_TYPE = "http://uri.etsi.org/TrstSvc/Svctype/"
+
+
+class TrustedListMixin:
+    @classmethod
+    def setUpClass(cls):
+        if trustedlist is None:
+            raise SkipTest("cryptography is not available")
+        super().setUpClass()
+
+
+class TestTrustServiceStatusList(TrustedListMixin, TestCase):
+    def test_get_tsl_pointer_by_territory(self):
+        tl = trustedlist.auto_from_etree(ET.parse(EU_TSL).getroot())
+        self.assertEqual(tl.get_tsl_pointer_by_territory("IT"), "https://example.org/it.xml")
+        self.assertEqual(tl.get_tsl_pointer_by_territory("FR"), "https://example.org/fr.xml")
+        self.assertIsNone(tl.get_tsl_pointer_by_territory("DE"))
+
+
+class TestLoadURL(TrustedListMixin, TestCase):
+    def load_url(self, data: bytes):
+        with mock.patch.object(trustedlist, "open_url", return_value=io.BytesIO(data)):
+            return trustedlist.load_url("https://example.org/it.xml")
+
+    def assert_load_url(self):
+        # The comments in the list do not get in the way of parsing
+        tl = self.load_url(IT_TSL.read_bytes())
+        providers = tl.trust_service_provider_list.trust_service_provider
+        self.assertEqual(len(providers), 2)
+        self.assertEqual([len(p.tsp_services.tsp_service) for p in providers], [2, 2])
+        self.assertEqual(
+                providers[1].tsp_services.tsp_service[1].service_information.service_status,
+                NS_STATUS + "recognisedatnationallevel")
+
+    def test_lxml(self):
+        if not trustedlist.HAVE_LXML:
+            raise SkipTest("lxml is not available")
+        self.assert_load_url()
+
+        # Entities are not expanded
+        tl = self.load_url(ENTITY_TSL)
+        self.assertEqual(
+                tl.scheme_information.pointers_to_other_tsl.other_tsl_pointer[0].tsl_location,
+                "https://example.org/it.xml")
+        self.assertIsNone(tl.get_tsl_pointer_by_territory("IT"))
+
+    def test_etree(self):
+        with mock.patch.object(trustedlist, "HAVE_LXML", False):
+            self.assert_load_url()
+
+            # defusedxml refuses entities
+            try:
+                from defusedxml import EntitiesForbidden
+            except ModuleNotFoundError:
+                raise SkipTest("defusedxml is not available")
+            with self.assertRaises(EntitiesForbidden):
+                self.load_url(ENTITY_TSL)
+
+
+class TestIterTSPServices(TrustedListMixin, TestCase):
+    def assert_iter_tsp_services(self):
+        with IT_TSL.open("rb") as fd:
+            services = list(trustedlist.iter_tsp_services(fd))
+        self.assertEqual(
+            [(s.service_information.service_type_identifier, s.service_information.service_status)
+             for s in services], [
+                (NS_TYPE + "CA/QC", NS_STATUS + "granted"),
+                (NS_TYPE + "CA/QC", NS_STATUS + "withdrawn"),
+                (NS_TYPE + "TSA/QTST", NS_STATUS + "granted"),
+                (NS_TYPE + "CA/QC", NS_STATUS + "recognisedatnationallevel"),
+            ])
+        for service in services:
+            self.assertIsInstance(service, trustedlist.TSPService)
+            self.assertEqual(len(service.service_information.service_digital_identity.digital_id[0].x509_certificate),
+                             1704)
+
+        with self.assertRaisesRegex(RuntimeError, "Root element .+FatturaElettronica is not"):
+            with open("tests/data/dati_trasporto.xml", "rb") as fd:
+                list(trustedlist.iter_tsp_services(fd))
+
+    def test_lxml(self):
+        if not trustedlist.HAVE_LXML:
+            raise SkipTest("lxml is not available")
+        self.assert_iter_tsp_services()
+
+    def test_etree(self):
+        with mock.patch.object(trustedlist, "HAVE_LXML", False):
+            self.assert_iter_tsp_services()
+
+
+def make_response(status_code, content=b"", headers=None, raw=None) -> "requests.Response":
+    """
+    Build a requests.Response as received from a streamed request
+    """
+    res = requests.Response()
+    res.status_code = status_code
+    res.reason = "Stub"
+    res.url = "https://example.org/"
+    res.headers.update(headers or {})
+    res.raw = io.BytesIO(content) if raw is None else raw
+    return res
+
+
+class BrokenRaw:
+    """
+    Response body that fails while being read, like a truncated download
+    """
+    def stream(self, chunk_size, decode_content=None):
+        import urllib3
+        yield b"partial"
+        raise urllib3.exceptions.ProtocolError("Connection broken")
+
+    def close(self):
+        pass
+
+
+class StubSession:
+    """
+    Minimal stand-in for requests.Session, returning the given responses in
+    order and recording the headers of each request
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, **kw):
+        self.requests.append(headers or {})
+        return self.responses.pop(0)
+
+
+class CacheDirMixin(TrustedListMixin):
+    """
+    Run each test with an empty cache directory
+    """
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = Path(workdir.name)
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": workdir.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+
+class TestFetchURL(CacheDirMixin, TestCase):
+    url = "https://example.org/tl.xml"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if requests is None:
+            raise SkipTest("requests is not available")
+
+    def fetch(self, *responses):
+        """
+        Run fetch_url with a session returning the given responses, and return
+        the session and the downloaded contents
+        """
+        session = StubSession(*responses)
+        with mock.patch.object(trustedlist, "_session", session):
+            pathname = trustedlist.fetch_url(self.url)
+        self.assertEqual(session.responses, [])
+        return session, pathname.read_bytes()
+
+    def test_etag(self):
+        session, body = self.fetch(make_response(200, b"first", {"ETag": '"1"'}))
+        self.assertEqual(session.requests, [{}])
+        self.assertEqual(body, b"first")
+        body_path, meta_path = trustedlist._cache_paths(self.url)
+        self.assertEqual(json.loads(meta_path.read_text())["etag"], '"1"')
+
+        # A 304 response reuses the cached body
+        session, body = self.fetch(make_response(304))
+        self.assertEqual(session.requests, [{"If-None-Match": '"1"'}])
+        self.assertEqual(body, b"first")
+
+        # A 200 response replaces it
+        session, body = self.fetch(make_response(200, b"second", {"ETag": '"2"'}))
+        self.assertEqual(session.requests, [{"If-None-Match": '"1"'}])
+        self.assertEqual(body, b"second")
+        self.assertEqual(json.loads(meta_path.read_text())["etag"], '"2"')
+
+    def test_max_age(self):
+        self.fetch(make_response(200, b"first", {"ETag": '"1"', "Cache-Control": "max-age=3600"}))
+
+        # The cached copy is still fresh: no request is made
+        session, body = self.fetch()
+        self.assertEqual(session.requests, [])
+        self.assertEqual(body, b"first")
+
+    def test_no_cache(self):
+        self.fetch(make_response(200, b"first", {"ETag": '"1"', "Cache-Control": "no-cache, max-age=3600"}))
+
+        # The cached copy is always revalidated
+        session, body = self.fetch(make_response(304, headers={"Cache-Control": "no-cache"}))
+        self.assertEqual(session.requests, [{"If-None-Match": '"1"'}])
+        self.assertEqual(body, b"first")
+
+        session, body = self.fetch(make_response(304))
+        self.assertEqual(session.requests, [{"If-None-Match": '"1"'}])
+        self.assertEqual(body, b"first")
+
+    def test_unusable_cache(self):
+        # Make the cache directory impossible to create
+        cache_home = self.workdir / "cache"
+        cache_home.write_text("")
+        os.environ["XDG_CACHE_HOME"] = cache_home.as_posix()
+
+        session = StubSession(make_response(200, b"body"))
+        with mock.patch.object(trustedlist, "_session", session):
+            with self.assertRaises(OSError):
+                trustedlist.fetch_url(self.url)
+            self.assertEqual(session.requests, [])
+
+            # open_url downloads without caching
+            with trustedlist.open_url(self.url) as fd:
+                self.assertEqual(fd.read(), b"body")
+
+    def test_broken_download(self):
+        session = StubSession(make_response(200, raw=BrokenRaw()))
+        with mock.patch.object(trustedlist, "_session", session):
+            with self.assertRaises(requests.RequestException):
+                trustedlist.fetch_url(self.url)
+        # No partial download is left in the cache
+        self.assertEqual(list((self.workdir / "a38").iterdir()), [])
+
+    def test_download_error(self):
+        session = StubSession(make_response(404))
+        with mock.patch.object(trustedlist, "_session", session):
+            with self.assertRaises(requests.HTTPError):
+                trustedlist.open_url(self.url)
+        self.assertEqual(session.requests, [{}])
+
+
+class TestCertsCache(CacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with IT_TSL.open("rb") as fd:
+            self.certs = trustedlist.parse_certs(fd)
+        self.cache_file = self.workdir / "a38" / "certs.json"
+        self.cache_file.parent.mkdir()
+
+    def test_roundtrip(self):
+        self.assertEqual(sorted(self.certs), ["ArubaPEC_S_p_A__NG_CA_3_a38_1", "ArubaPEC_S_p_A__NG_CA_3_a38_2"])
+        self.assertIsNone(trustedlist._load_cached_certs("digest"))
+        trustedlist._save_cached_certs("digest", self.certs)
+        self.assertEqual(trustedlist._load_cached_certs("digest"), self.certs)
+        self.assertIsNone(trustedlist._load_cached_certs("other"))
+
+    def test_malformed(self):
+        trustedlist._save_cached_certs("digest", self.certs)
+        valid = json.loads(self.cache_file.read_text())
+        name = "ArubaPEC_S_p_A__NG_CA_3_a38_1"
+        for label, contents in (
+                ("not json", "{"),
+                ("not a dict", "[]"),
+                ("no digest", json.dumps({"certs": valid["certs"]})),
+                ("no certs", json.dumps({"digest": "digest"})),
+                ("certs not a dict", json.dumps({"digest": "digest", "certs": []})),
+                ("bad base64", json.dumps({"digest": "digest", "certs": {name: "!!!"}})),
+                ("bad der", json.dumps({"digest": "digest", "certs": {name: "AAAA"}})),
+                ("not a string", json.dumps({"digest": "digest", "certs": {name: 1}}))):
+            with self.subTest(label=label):
+                self.cache_file.write_text(contents)
+                with self.assertLogs(level="WARNING"):
+                    self.assertIsNone(trustedlist._load_cached_certs("digest"))
+
+    def test_unusable_cache(self):
+        self.cache_file.mkdir()
+        self.assertIsNone(trustedlist._load_cached_certs("digest"))
+        with self.assertLogs(level="WARNING"):
+            trustedlist._save_cached_certs("digest", self.certs)
+
+
+class TestLoadCerts(CacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Start without the certificates loaded by other tests
+        certs_cache = mock.patch.object(trustedlist, "_certs_cache", None)
+        certs_cache.start()
+        self.addCleanup(certs_cache.stop)
+        self.cache_file = self.workdir / "a38" / "certs.json"
+        self.cache_file.parent.mkdir()
+
+    def load_certs(self, data: bytes):
+        """
+        Run load_certs with data as the IT trusted list, and return its result
+        and how many times the list was parsed
+        """
+        eu_tl = trustedlist.auto_from_etree(ET.parse(EU_TSL).getroot())
+        with (mock.patch.object(trustedlist, "load_url", return_value=eu_tl),
+              mock.patch.object(trustedlist, "open_url", return_value=io.BytesIO(data)) as open_url,
+              mock.patch.object(trustedlist, "parse_certs", wraps=trustedlist.parse_certs) as parse_certs):
+            res = trustedlist.load_certs()
+        open_url.assert_called_once_with("https://example.org/it.xml")
+        return res, parse_certs.call_count
+
+    def test_memo(self):
+        data = IT_TSL.read_bytes()
+        certs, parsed = self.load_certs(data)
+        self.assertEqual(parsed, 1)
+        self.assertEqual(sorted(certs), ["ArubaPEC_S_p_A__NG_CA_3_a38_1", "ArubaPEC_S_p_A__NG_CA_3_a38_2"])
+
+        # The same list is not parsed again, even without the disk cache
+        self.cache_file.unlink()
+        res, parsed = self.load_certs(data)
+        self.assertEqual(parsed, 0)
+        self.assertEqual(res, certs)
+        # Callers get their own dict
+        self.assertIsNot(res, certs)
+
+        # A changed list is parsed again
+        res, parsed = self.load_certs(data + b"\n")
+        self.assertEqual(parsed, 1)
+        self.assertEqual(res, certs)
+
+        # Without the in-memory copy, the disk cache is used
+        trustedlist._certs_cache = None
+        res, parsed = self.load_certs(data + b"\n")
+        self.assertEqual(parsed, 0)
+        self.assertEqual(res, certs)
+
+
+def make_cert(common_name: str) -> "x509.Certificate":
+    """
+    Create a self-signed certificate with the given common name
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+
+
+class TestRehash(TrustedListMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = Path(workdir.name)
+
+    def write_cert(self, fname: str, cert: "x509.Certificate"):
+        (self.workdir / fname).write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+
+    def links(self):
+        """
+        Return a dict mapping the names of the symlinks in the work directory
+        to their targets
+        """
+        return {
+            p.name: os.readlink(p) for p in self.workdir.iterdir() if p.is_symlink()
+        }
+
+    def test_ca_cert_hash(self):
+        cert = x509.load_pem_x509_certificate(CA_CERT.encode())
+        self.assertEqual(trustedlist.subject_hash(cert) + ".0", CA_CERT_HASH)
+
+    def test_rehash(self):
+        ca = x509.load_pem_x509_certificate(CA_CERT.encode())
+        first = make_cert("First CA")
+        # Names are compared after normalizing case and whitespace
+        second = make_cert(" first   ca ")
+        other = make_cert("Other CA")
+        first_hash = trustedlist.subject_hash(first)
+        other_hash = trustedlist.subject_hash(other)
+        self.assertEqual(trustedlist.subject_hash(second), first_hash)
+        self.assertNotEqual(other_hash, first_hash)
+
+        self.write_cert("ca.crt", ca)
+        self.write_cert("first.crt", first)
+        self.write_cert("second.pem", second)
+        self.write_cert("other.cer", other)
+        # Same certificate as first.crt
+        self.write_cert("first-copy.crt", first)
+        # Files that are not certificates
+        (self.workdir / "broken.crt").write_text("this is not a certificate")
+        (self.workdir / "README").write_text("this is not a certificate")
+        # Stale links
+        (self.workdir / "01234567.0").symlink_to("removed.crt")
+        (self.workdir / (other_hash + ".1")).symlink_to("other.cer")
+
+        with self.assertLogs(level="WARNING") as log:
+            trustedlist.rehash(self.workdir)
+        self.assertEqual(len(log.records), 1)
+        self.assertIn("broken.crt", log.output[0])
+
+        self.assertEqual(self.links(), {
+            CA_CERT_HASH: "ca.crt",
+            first_hash + ".0": "first-copy.crt",
+            first_hash + ".1": "second.pem",
+            other_hash + ".0": "other.cer",
+        })
+
+        # Rehashing again with already parsed certificates gives the same
+        # result
+        links = self.links()
+        with self.assertLogs(level="WARNING"):
+            trustedlist.rehash(self.workdir, {"ca.crt": ca, "first.crt": first, "other.cer": other})
+        self.assertEqual(self.links(), links)
+
+
+class TestUpdateCapath(TrustedListMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.capath = Path(workdir.name) / "capath"
+        self.first = make_cert("First CA")
+        self.second = make_cert("Second CA")
+        self.third = make_cert("Third CA")
+
+    def update_capath(self, certs, remove_old):
+        with mock.patch.object(trustedlist, "load_certs", return_value=certs):
+            trustedlist.update_capath(self.capath, remove_old=remove_old)
+
+    def assert_capath(self, certs):
+        """
+        Check that capath contains the PEM files and hash links for exactly
+        the given certificates
+        """
+        expected = {}
+        for name, cert in certs.items():
+            fname = name + ".crt"
+            self.assertEqual(
+                    (self.capath / fname).read_bytes(), cert.public_bytes(serialization.Encoding.PEM))
+            expected[trustedlist.subject_hash(cert) + ".0"] = fname
+        self.assertEqual(sorted(p.name for p in self.capath.glob("*.crt")), sorted(n + ".crt" for n in certs))
+        self.assertEqual({
+            p.name: os.readlink(p) for p in self.capath.iterdir() if p.is_symlink()
+        }, expected)
+
+    def test_update_capath(self):
+        # The directory is created if missing
+        self.update_capath({"first": self.first, "second": self.second}, remove_old=False)
+        self.assert_capath({"first": self.first, "second": self.second})
+
+        # Without remove_old, certificates no longer in the list are kept
+        self.update_capath({"first": self.first, "third": self.third}, remove_old=False)
+        self.assert_capath({"first": self.first, "second": self.second, "third": self.third})
+
+    def test_remove_old(self):
+        self.update_capath({"first": self.first, "second": self.second}, remove_old=True)
+        self.assert_capath({"first": self.first, "second": self.second})
+        (self.capath / "README").write_text("not a certificate")
+
+        # With remove_old, certificates no longer in the list are removed
+        # together with their links, and other files are left alone.
+        # Existing files are rewritten with the new certificates
+        renewed = make_cert("First CA")
+        self.update_capath({"first": renewed, "third": self.third}, remove_old=True)
+        self.assert_capath({"first": renewed, "third": self.third})
+        self.assertTrue((self.capath / "README").exists())